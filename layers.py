@@ -2,7 +2,6 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
-import einops
 import copy
 try:
     import sys
@@ -41,12 +40,132 @@ class StridedConv(nn.Module):
             else:
                 kwargs['padding'] = kwargs['kernel_size'] // 2
         super().__init__(*args, **kwargs)
-        downsample = "b c (w k1) (h k2) -> b (c k1 k2) w h"
+        # "b c (w k1) (h k2) -> b (c k1 k2) w h" with k1 = k2 = 2
         if striding:
-            self.register_forward_pre_hook(lambda _, x: \
-                    einops.rearrange(x[0], downsample, k1=2, k2=2))  
+            self.register_forward_pre_hook(lambda _, x: (F.pixel_unshuffle(x[0], 2),))
+
+
+# Extend this class to get the shared parts of the FFT Cayley convs: per-size
+# shift matrices, weight and input spectra, alpha and the eval-cached operator
+class FFTConvMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._Qfft_cache = None
+        self._HQ_cache = None
+        self._HQ_source = None
+        self._weight_version = None
+        self._cached_n = None
+
+    def _drop_operator_cache(self):
+        self._Qfft_cache = None
+        self._HQ_cache = None
+        self._HQ_source = None
+
+    def train(self, mode=True):
+        # weights may change again, so drop the eval-time operators
+        if mode:
+            self._drop_operator_cache()
+        return super().train(mode)
+
+    # .to(), .cuda() and .double() go through here without bumping
+    # weight._version, so the cached operator would keep the old device/dtype
+    def _apply(self, fn, *args, **kwargs):
+        self._drop_operator_cache()
+        return super()._apply(fn, *args, **kwargs)
+
+    def fft_shift_matrix(self, n, s):
+        a = torch.arange(n, device=self.weight.device)
+        shift = a[:, None] + a[None, :]
+        return torch.exp(1j * 2 * np.pi * s * shift / n)
+
+    def get_shift_matrix(self, n):
+        name = f'shift_matrix_{n}'
+        if not hasattr(self, name):
+            s = (self.weight.shape[2] - 1) // 2
+            # a normal tensor even under inference_mode, as backward saves it
+            with torch.inference_mode(False):
+                shift_matrix = self.fft_shift_matrix(n, -s)[:, :(n//2 + 1)].reshape(n * (n // 2 + 1), 1, 1)
+            self.register_buffer(name, shift_matrix, persistent=False)
+        return getattr(self, name)
+
+    # Shifted and conjugated spectrum of a (cout, cin, k, k) kernel, laid out
+    # contiguously as (n * (n // 2 + 1), cout, cin) for the per-frequency matmuls
+    def fft_weight(self, weight, n):
+        cout, cin, _, _ = weight.shape
+        wfft = torch.fft.rfft2(weight, (n, n)).movedim((0, 1), (-2, -1)).reshape(n * (n // 2 + 1), cout, cin)
+        return self.get_shift_matrix(n) * wfft.conj()
+
+    # Input spectrum as (n * (n // 2 + 1), cin, 2 * batches), real then imag
+    # parts; under no_grad it goes into buffers reused across forwards
+    def fft_input(self, x):
+        batches, cin, n, _ = x.shape
+        shape = (n * (n // 2 + 1), cin, 2 * batches)
+        pooled = not torch.is_grad_enabled()
+        if pooled:
+            out = self._buffer('_xfft_buf', (batches, cin, n, n // 2 + 1), x.dtype.to_complex(), x.device)
+            xfft = torch.fft.rfft2(x, out=out)
+        else:
+            xfft = torch.fft.rfft2(x)
+        xfft = torch.view_as_real(xfft).permute(2, 3, 1, 4, 0)
+        if pooled:
+            return self._buffer('_xperm_buf', xfft.shape, xfft.dtype, x.device).copy_(xfft).view(shape)
+        return xfft.reshape(shape)
+
+    # alpha is the norm of the first weight spectrum, filled in on device and
+    # NaN until then. It stays frozen, as it was never handed to the optimizer
+    # when it was created lazily in forward
+    def init_alpha(self, wfft):
+        if not self._alpha_initialized:
+            with torch.no_grad():
+                self.alpha.copy_(wfft.detach().norm())
+            self._alpha_initialized = True
+
+    # a checkpoint saved before the first forward carries a NaN alpha
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+        self._alpha_initialized = not torch.isnan(self.alpha).item()
+
+    # Real and imaginary parts of cayley(alpha * wfft / wfft.norm(), ED); at eval
+    # the weights are frozen, so like CayleyLinear.Q the operator is reused,
+    # together with the sum of its parts for complex_matmul
+    def cayley_operator(self, n, ED=False):
+        if not self.training and self._Qfft_cache is not None \
+                and self._weight_version == self.weight._version and self._cached_n == n:
+            return self._Qfft_cache
+        wfft = self.fft_weight(self.weight, n)
+        self.init_alpha(wfft)
+        build = _build_operator_compiled if self.training else _build_operator
+        Q = build(wfft.real, wfft.imag, self.alpha, ED)
+        if not self.training:
+            Qr, Qi = Q[0].detach(), Q[1].detach()
+            Q = (Qr, Qi, Qr + Qi)
+            # inference tensors can't be saved for backward by a later forward
+            if not torch.is_inference_mode_enabled():
+                self._Qfft_cache = Q
+                self._weight_version = self.weight._version
+                self._cached_n = n
+        return Q
+
+    # A constant offset only lives in the DC bin of a (n, n // 2 + 1, cout, batches)
+    # spectrum, so adding it there lets irfft2 apply the bias
+    def _add_bias_dc(self, yfft, n):
+        if self.bias is not None:
+            yfft[0, 0] += n * n * self.bias[:, None]
+
+    # Flat scratch tensor kept as a plain attribute (not saved, not a buffer),
+    # reallocated only when a larger size, another dtype or device is needed;
+    # always a normal tensor so no_grad forwards can still write to it after
+    # one under inference_mode
+    def _buffer(self, name, shape, dtype, device):
+        numel = int(np.prod(shape))
+        buf = getattr(self, name, None)
+        if buf is None or buf.numel() < numel or buf.dtype != dtype or buf.device != device:
+            with torch.inference_mode(False):
+                buf = torch.empty(numel, dtype=dtype, device=device)
+            setattr(self, name, buf)
+        return buf[:numel].view(shape)
+
 
-        
 def cayley(W, ED=False):
     if len(W.shape) == 2:
         return cayley(W[None])[0]
@@ -56,8 +175,7 @@ def cayley(W, ED=False):
         I = torch.eye(cin, dtype=W.dtype, device=W.device)[None, :, :]
         A = W - W.conj().transpose(1, 2)
         # print((I+A).shape)
-        iIpA = torch.inverse(I + A)
-        return iIpA @ (I - A)
+        return torch.linalg.solve(I + A, I - A)
 
     else:
         _, cout, cin = W.shape
@@ -66,40 +184,97 @@ def cayley(W, ED=False):
         U, V = W[:, :cin], W[:, cin:]
         I = torch.eye(cin, dtype=W.dtype, device=W.device)[None, :, :]
         A = U - U.conj().transpose(1, 2) + V.conj().transpose(1, 2) @ V
-        iIpA = torch.inverse(I + A)
-        return torch.cat((iIpA @ (I - A), -2 * V @ iIpA), axis=1)
+        # factor I + A once; V @ (I + A)^-1 is a right-hand solve against it
+        LU, pivots = torch.linalg.lu_factor(I + A)
+        return torch.cat((torch.linalg.lu_solve(LU, pivots, I - A),
+                          -2 * torch.linalg.lu_solve(LU, pivots, V, left=False)), axis=1)
 
 
+# Same as cayley, but on the real and imaginary parts of W, so that
+# everything runs as real kernels. A complex system M x = b is solved as
+# the real system [[Mr, -Mi], [Mi, Mr]] [xr; xi] = [br; bi].
+def cayley_real(Wr, Wi, ED=False):
+    if len(Wr.shape) == 2:
+        Qr, Qi = cayley_real(Wr[None], Wi[None], ED)
+        return Qr[0], Qi[0]
 
+    if ED:
+        _, cin, cin = Wr.shape
+        I = torch.eye(cin, dtype=Wr.dtype, device=Wr.device)[None, :, :]
+        Ar = Wr - Wr.transpose(1, 2)
+        Ai = Wi + Wi.transpose(1, 2)
+        X = torch.linalg.solve(_real_block(I + Ar, Ai), torch.cat((I - Ar, -Ai), 1))
+        return X[:, :cin], X[:, cin:]
 
-class CayleyConv(StridedConv, nn.Conv2d):
+    else:
+        _, cout, cin = Wr.shape
+        if cin > cout:
+            # contiguous copies so the batched factorization sees row-major matrices
+            Qr, Qi = cayley_real(Wr.transpose(1, 2).contiguous(), Wi.transpose(1, 2).contiguous())
+            return Qr.transpose(1, 2), Qi.transpose(1, 2)
+        Ur, Ui, Vr, Vi = Wr[:, :cin], Wi[:, :cin], Wr[:, cin:], Wi[:, cin:]
+        I = torch.eye(cin, dtype=Wr.dtype, device=Wr.device)[None, :, :]
+        VrT, ViT = Vr.transpose(1, 2), Vi.transpose(1, 2)
+        Ar = Ur - Ur.transpose(1, 2) + VrT @ Vr + ViT @ Vi
+        Ai = Ui + Ui.transpose(1, 2) + VrT @ Vi - ViT @ Vr
+        LU, pivots = torch.linalg.lu_factor(_real_block(I + Ar, Ai))
+        X = torch.linalg.lu_solve(LU, pivots, torch.cat((I - Ar, -Ai), 1))
+        # Z (I + A) = V  <=>  [Zr, -Zi] [[Mr, -Mi], [Mi, Mr]] = [Vr, -Vi]
+        Z = torch.linalg.lu_solve(LU, pivots, torch.cat((Vr, -Vi), 2), left=False)
+        return torch.cat((X[:, :cin], -2 * Z[:, :, :cin]), 1), \
+               torch.cat((X[:, cin:], 2 * Z[:, :, cin:]), 1)
+
+
+def _real_block(Mr, Mi):
+    return torch.cat((torch.cat((Mr, -Mi), 2), torch.cat((Mi, Mr), 2)), 1)
+
+
+# (Ar + i Ai) @ (Br + i Bi) with real matmuls, where A is (Ar, Ai) and B
+# is passed as torch.cat((Br, Bi), -1). If A also carries Ar + Ai, as the
+# cached eval operators do, Gauss's trick needs three matmuls instead of four.
+def complex_matmul(A, B):
+    if len(A) == 2:
+        Ar, Ai = A
+        Pr, Pi = (Ar @ B).chunk(2, -1)
+        Qr, Qi = (Ai @ B).chunk(2, -1)
+        return Pr - Qi, Pi + Qr
+    Ar, Ai, Asum = A
+    Br, Bi = B.chunk(2, -1)
+    k1 = Asum @ Br
+    k2 = Ar @ (Bi - Br)
+    k3 = Ai @ (Br + Bi)
+    return k1 - k3, k1 + k2
+
+
+# Real and imaginary parts of cayley(alpha * wfft / wfft.norm(), ED)
+def _build_operator(wfft_r, wfft_i, alpha, ED=False):
+    scale = alpha / (wfft_r.square().sum() + wfft_i.square().sum()).sqrt()
+    return cayley_real(scale * wfft_r, scale * wfft_i, ED)
+
+# Compiled once here so all Cayley convs share the kernels; only used while
+# training, inference goes through the eval caches instead
+_build_operator_compiled = torch.compile(_build_operator, dynamic=True)
+
+
+
+
+class CayleyConv(FFTConvMixin, StridedConv, nn.Conv2d):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.register_parameter('alpha', None)
-
-    def fft_shift_matrix(self, n, s):
-        shift = torch.arange(0, n).repeat((n, 1))
-        shift = shift + shift.T
-        return torch.exp(1j * 2 * np.pi * s * shift / n)
+        self.alpha = nn.Parameter(torch.full((), float('nan')), requires_grad=False)
+        self._alpha_initialized = False
     
     def forward(self, x):
         cout, cin, _, _ = self.weight.shape
         batches, _, n, _ = x.shape
-        if not hasattr(self, 'shift_matrix'):
-            s = (self.weight.shape[2] - 1) // 2
-            self.shift_matrix = self.fft_shift_matrix(n, -s)[:, :(n//2 + 1)].reshape(n * (n // 2 + 1), 1, 1).to(x.device)
-        xfft = torch.fft.rfft2(x).permute(2, 3, 1, 0).reshape(n * (n // 2 + 1), cin, batches)
-        wfft = self.shift_matrix * torch.fft.rfft2(self.weight, (n, n)).reshape(cout, cin, n * (n // 2 + 1)).permute(2, 0, 1).conj()
-        if self.alpha is None:
-            self.alpha = nn.Parameter(torch.tensor(wfft.norm().item(), requires_grad=True).to(x.device))
-        yfft = (cayley(self.alpha * wfft / wfft.norm()) @ xfft).reshape(n, n // 2 + 1, cout, batches)
-        y = torch.fft.irfft2(yfft.permute(3, 2, 0, 1))
-        if self.bias is not None:
-            y += self.bias[:, None, None]
-        return y
+        xfft = self.fft_input(x)
+        Q = self.cayley_operator(n)
+        yfft = torch.complex(*complex_matmul(Q, xfft)).reshape(n, n // 2 + 1, cout, batches)
+        self._add_bias_dc(yfft, n)
+        return torch.fft.irfft2(yfft.permute(3, 2, 0, 1))
 
 
-class CayleyConvED(StridedConv, nn.Conv2d):
+class CayleyConvED(FFTConvMixin, StridedConv, nn.Conv2d):
     def __init__(self, *args, **kwargs):
         # super().__init__(*args, **kwargs)
         if 'stride' in kwargs and kwargs['stride'] == 2:
@@ -115,81 +290,87 @@ class CayleyConvED(StridedConv, nn.Conv2d):
         super().__init__(args[0], self.xcin, self.k, padding=self.padding, stride=self.stride)
         self.bias = nn.Parameter(torch.zeros(args[1]))
         self.args = args
-        self.register_parameter('alpha', None)
-        self.H = None
+        self.alpha = nn.Parameter(torch.full((), float('nan')), requires_grad=False)
+        self._alpha_initialized = False
+        # real and imaginary parts of H, contiguous for bmm; set by genH
+        self.register_buffer('Hr', None, persistent=False)
+        self.register_buffer('Hi', None, persistent=False)
 
 
     def genH(self, n, k, cout, xcin):
-        conv = nn.Conv2d(xcin, cout, k, bias=False)
-        s = (conv.weight.shape[2] - 1) // 2
-        shift_matrix = self.fft_shift_matrix(n, -s)[:, :(n//2 + 1)].reshape(n * (n // 2 + 1), 1, 1).to(conv.weight.device)
+        conv = nn.Conv2d(xcin, cout, k, bias=False).to(self.weight.device)
         optimizer = torch.optim.SGD(conv.parameters(), lr=0.1) #lr=0.1
         loss = torch.nn.MSELoss(reduction='mean')
+        # loop invariants: the off-diagonal indices of the Gram matrix and the norm targets
+        with torch.no_grad():
+            b, d = n * (n // 2 + 1), max(cout, xcin)
+            row, col = torch.triu_indices(d, d, offset=1, device=conv.weight.device)
+            Hnorm_target = torch.full((b, cout), np.sqrt(xcin/cout), device=conv.weight.device, dtype=conv.weight.dtype)
+            HHnorm_target = torch.ones((b, xcin), device=conv.weight.device, dtype=conv.weight.dtype)
         for i in range(100): #iteration 2000
-            H = shift_matrix*torch.fft.rfft2(conv.weight, (n, n)).reshape(cout, xcin, n * (n//2+1)).permute(2, 0, 1).conj()
-            b, cout, xcin = H.shape
+            H = self.fft_weight(conv.weight, n)
             Hnorm = torch.norm(H, dim=2)
             
-            L1 = loss(Hnorm, torch.ones_like(Hnorm, dtype=Hnorm.dtype)*np.sqrt(xcin/cout))
+            L1 = loss(Hnorm, Hnorm_target)
             
             HHnorm = torch.norm(H, dim=1)
-            L2 = loss(HHnorm, torch.ones_like(HHnorm, dtype=HHnorm.dtype))
+            L2 = loss(HHnorm, HHnorm_target)
 
             if cout >= xcin:
-                HH = torch.einsum('npc, nqc -> npq', H.conj(), H)
-                M = torch.triu(torch.ones((cout, cout), dtype=bool), diagonal=1).repeat(b, 1, 1).to(H.device)
-                HHorth = torch.abs(HH[M])
-                L3 = loss(HHorth, torch.zeros_like(HHorth, dtype=HHorth.dtype))
-                L = (cout-1)/2*L1 + (cout-1)/2*L2 + L3
+                HH = torch.bmm(H.conj(), H.transpose(1, 2))
             else:
-                HH = torch.einsum('ndp, ndq -> npq', H.conj(), H)
-                M = torch.triu(torch.ones((xcin, xcin), dtype=bool), diagonal=1).repeat(b, 1, 1).to(H.device)               
-                HHorth = torch.abs(HH[M])
-                L3 = loss(HHorth, torch.zeros_like(HHorth, dtype=HHorth.dtype))
-                L = (xcin-1)/2*L1 + (xcin-1)/2*L2 + L3
+                HH = torch.bmm(H.conj().transpose(1, 2), H)
+            L3 = HH[:, row, col].abs().square().mean()
+            L = (d-1)/2*L1 + (d-1)/2*L2 + L3
 
             optimizer.zero_grad()
             L.backward()
             optimizer.step()
 
-        H = shift_matrix*torch.fft.rfft2(conv.weight, (n, n)).reshape(cout, xcin, n * (n//2+1)).permute(2, 0, 1).conj()
-        self.H = H.to(self.weight.device).detach()
-
-
-    def fft_shift_matrix(self, n, s):
-        shift = torch.arange(0, n).repeat((n, 1))
-        shift = shift + shift.T
-        return torch.exp(1j * 2 * np.pi * s * shift / n)
+        with torch.no_grad():
+            H = self.fft_weight(conv.weight, n)
+        # .real / .imag are stride-2 views that bmm would copy on every forward
+        self.Hr = H.real.contiguous()
+        self.Hi = H.imag.contiguous()
 
     
     def forward(self, x):
         cout = self.args[1]
 
         batches, _, n, _ = x.shape
-        if not hasattr(self, 'shift_matrix'):
-            s = (self.weight.shape[2] - 1) // 2
-            self.shift_matrix = self.fft_shift_matrix(n, -s)[:, :(n//2 + 1)].reshape(n * (n // 2 + 1), 1, 1).to(x.device)
 
-        xfft = torch.fft.rfft2(x).permute(2, 3, 1, 0).reshape(n * (n // 2 + 1), self.xcin, batches)
+        xfft = self.fft_input(x)
 
-        wfft = self.shift_matrix * torch.fft.rfft2(self.weight, (n, n)).reshape(self.xcin, self.xcin, n * (n // 2 + 1)).permute(2, 0, 1).conj()
-        if self.alpha is None:
-            self.alpha = nn.Parameter(torch.tensor(wfft.norm().item(), requires_grad=True).to(x.device))
-
-        if self.H == None:
+        if self.Hr is None:
             self.genH(n, self.kernel_size[0], cout, self.xcin)
 
-        cwxfft = self.H @ cayley(self.alpha * wfft / wfft.norm(), ED=True) @ xfft
+        Q = self.cayley_operator(n, ED=True)
+        if self.training:
+            # (H @ Q) @ x costs cout*xcin*(xcin + B) per bin, H @ (Q @ x) costs
+            # xcin*B*(xcin + cout): the first is cheaper exactly when cout < B
+            if cout < batches:
+                HQ = complex_matmul((self.Hr, self.Hi), torch.cat(Q, -1))
+                cwxfft = complex_matmul(HQ, xfft)
+            else:
+                wxfft = torch.cat(complex_matmul(Q, xfft), -1)
+                cwxfft = complex_matmul((self.Hr, self.Hi), wxfft)
+        else:
+            # H is fixed after genH, so fold it into the cached operator
+            HQ = self._HQ_cache
+            if HQ is None or self._HQ_source is not Q:
+                HQr, HQi = complex_matmul((self.Hr, self.Hi), torch.cat(Q[:2], -1))
+                HQ = (HQr, HQi, HQr + HQi)
+                if not torch.is_inference_mode_enabled():
+                    self._HQ_cache, self._HQ_source = HQ, Q
+            cwxfft = complex_matmul(HQ, xfft)
 
-        yfft = (cwxfft).reshape(n, n // 2 + 1, cout, batches)
+        yfft = torch.complex(*cwxfft).reshape(n, n // 2 + 1, cout, batches)
+        self._add_bias_dc(yfft, n)
 
-        y = torch.fft.irfft2(yfft.permute(3, 2, 0, 1))
-        if self.bias is not None:
-            y += self.bias[:, None, None]
-        return y
+        return torch.fft.irfft2(yfft.permute(3, 2, 0, 1))
 
 
-class CayleyConvED2(StridedConv, nn.Conv2d):
+class CayleyConvED2(FFTConvMixin, StridedConv, nn.Conv2d):
     def __init__(self, *args, **kwargs):
         # super().__init__(*args, **kwargs)
         if 'stride' in kwargs and kwargs['stride'] == 2:
@@ -205,69 +386,50 @@ class CayleyConvED2(StridedConv, nn.Conv2d):
         super().__init__(args[0], self.xcin, self.k, padding=self.padding, stride=self.stride)
         self.bias = nn.Parameter(torch.zeros(args[1]))
         self.args = args
-        self.register_parameter('alpha', None)
+        self.alpha = nn.Parameter(torch.full((), float('nan')), requires_grad=False)
+        self._alpha_initialized = False
         self.H = None
 
 
     def genH(self, cout, xcin):
         loss = torch.nn.MSELoss(reduction='mean')
-        A = torch.randn(cout, xcin)
-        A.requires_grad_(True)
-        lr = 0.1
+        H = nn.Parameter(torch.randn(cout, xcin))
+        optimizer = torch.optim.SGD([H], lr=0.1)
+        with torch.no_grad():
+            d = max(cout, xcin)
+            row, col = torch.triu_indices(d, d, offset=1)
+            Hnorm_target = torch.full((cout,), np.sqrt(xcin/cout))
+            HHnorm_target = torch.ones(xcin)
         for i in range(100):
-            H = A.detach()
-            H.requires_grad_(True)
             Hnorm = torch.norm(H, dim=1)
-            L1 = loss(Hnorm, torch.ones_like(Hnorm, dtype=Hnorm.dtype)*np.sqrt(xcin/cout))
+            L1 = loss(Hnorm, Hnorm_target)
             HHnorm = torch.norm(H, dim=0)
-            L2 = loss(HHnorm, torch.ones_like(HHnorm, dtype=HHnorm.dtype))
+            L2 = loss(HHnorm, HHnorm_target)
             if cout >= xcin:
                 HH =  H @ H.T
-                M = torch.triu(torch.ones((cout, cout), dtype=bool), diagonal=1).to(H.device)
-                # HHorth = torch.abs(HH[M])
-                L3 = loss(HH[M], torch.zeros_like(HH[M], dtype=HH[M].dtype))
-                L = (cout-1)/2*L1 + (cout-1)/2*L2 + L3
             else:
                 HH =H.T @ H
-                M = torch.triu(torch.ones((xcin, xcin), dtype=bool), diagonal=1).repeat(1, 1).to(H.device)               
-                # HHorth = torch.abs(HH[M])
-                L3 = loss(HH[M], torch.zeros_like(HH[M], dtype=HH[M].dtype))
-                L = (xcin-1)/2*L1 + (xcin-1)/2*L2 + L3
+            L3 = HH[row, col].square().mean()
+            L = (d-1)/2*L1 + (d-1)/2*L2 + L3
+            optimizer.zero_grad(set_to_none=True)
             L.backward()
-            A = H - lr*H.grad
-        H = A[:, :, None, None]
-        self.H = H.detach()
-
+            optimizer.step()
+        self.H = H.detach()[:, :, None, None]
 
-    def fft_shift_matrix(self, n, s):
-        shift = torch.arange(0, n).repeat((n, 1))
-        shift = shift + shift.T
-        return torch.exp(1j * 2 * np.pi * s * shift / n)
 
-    
     def forward(self, x):
         cout = self.args[1]
 
         batches, _, n, _ = x.shape
-        if not hasattr(self, 'shift_matrix'):
-            s = (self.weight.shape[2] - 1) // 2
-            self.shift_matrix = self.fft_shift_matrix(n, -s)[:, :(n//2 + 1)].reshape(n * (n // 2 + 1), 1, 1).to(x.device)
-
-        xfft = torch.fft.rfft2(x).permute(2, 3, 1, 0).reshape(n * (n // 2 + 1), self.xcin, batches)
 
-        wfft = self.shift_matrix * torch.fft.rfft2(self.weight, (n, n)).reshape(self.xcin, self.xcin, n * (n // 2 + 1)).permute(2, 0, 1).conj()
-        if self.alpha is None:
-            self.alpha = nn.Parameter(torch.tensor(wfft.norm().item(), requires_grad=True).to(x.device))
+        xfft = self.fft_input(x)
 
-        wxfft = cayley(self.alpha * wfft / wfft.norm(), ED=True) @ xfft
-        yfft = wxfft.reshape(n, n // 2 + 1, self.xcin, batches)
+        wxfft = complex_matmul(self.cayley_operator(n, ED=True), xfft)
+        yfft = torch.complex(*wxfft).reshape(n, n // 2 + 1, self.xcin, batches)
         y = torch.fft.irfft2(yfft.permute(3, 2, 0, 1))
         if self.H == None:
             self.genH(cout, self.xcin)
-        y = torch.nn.functional.conv2d(y, self.H.to(x.device))
-        if self.bias is not None:
-            y += self.bias[:, None, None]
-        return y
+        return torch.nn.functional.conv2d(y, self.H.to(x.device), self.bias)
 
 
 class CayleyLinear(nn.Linear):
@@ -301,18 +463,33 @@ class SVCM(StridedConv, _SVCM):
     pass
 
 class PlainConv(nn.Conv2d):
-    def forward(self, x):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the kernel size is fixed, so pick the padding variant once
         if self.kernel_size[0] == 1:
-            return super().forward(x)
-        if self.kernel_size[0] == 2:
-            return super().forward(F.pad(x, (0,1,0,1), mode="circular"))
+            self._forward = self._forward_k1
+        elif self.kernel_size[0] == 2:
+            self._forward = self._forward_k2
+        else:
+            self._forward = self._forward_kN
+
+    def _forward_k1(self, x):
+        return super().forward(x)
+
+    def _forward_k2(self, x):
+        return super().forward(F.pad(x, (0,1,0,1), mode="circular"))
+
+    def _forward_kN(self, x):
         return super().forward(F.pad(x, (1,1,1,1)))
+
+    def forward(self, x):
+        return self._forward(x)
     
 class GroupSort(nn.Module):
     def forward(self, x):
-        a, b = x.split(x.size(1) // 2, 1)
-        a, b = torch.max(a, b), torch.min(a, b)
-        return torch.cat([a, b], dim=1)
+        # pairwise min/max of the two channel halves in a single reduction
+        lo, hi = torch.aminmax(x.unflatten(1, (2, -1)), dim=1)
+        return torch.cat([hi, lo], dim=1)
     
 class ConvexCombo(nn.Module):
     def __init__(self):
@@ -331,5 +508,5 @@ class Normalize(nn.Module):
         
     def forward(self, x):
         if self.std is not None:
-            return (x - self.mu) / self.std
+            return (x - self.mu).div_(self.std)
         return (x - self.mu)
\ No newline at end of file
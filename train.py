@@ -6,7 +6,6 @@ if __name__ == '__main__':
     import torch.nn.functional as F
     import torch.optim as optim
     import numpy as np
-    import einops
     import time
     import os
     import utils
@@ -29,9 +28,14 @@ if __name__ == '__main__':
     parser.add_argument('--stddev', action='store_true')
     parser.add_argument('--epochs', default=100, type=int)
     parser.add_argument('--eps', default=36.0, type=float)
+    # TF32 speeds up the real frequency-domain matmuls on Ampere and newer GPUs,
+    # but the layers are then only orthogonal up to TF32 precision
+    parser.add_argument('--tf32', action='store_true')
 
     args = parser.parse_args()
 
+    torch.backends.cuda.matmul.allow_tf32 = args.tf32
+
     eps = args.eps / 255.0
     alpha = eps / 4.0
 